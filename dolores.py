@@ -3,20 +3,24 @@
 import os
 import sys
 import argparse
+import functools
+import hashlib
+import json
+import re
+import shlex
 import subprocess
 import tempfile
+import time
 import asyncio
 import threading
 import select
 import termios
 import tty
-from typing import Optional, List, Dict
+from typing import TYPE_CHECKING, Optional, List, Dict, Union
 from dataclasses import dataclass
 
-from prompt_toolkit import PromptSession
-from prompt_toolkit.key_binding import KeyBindings
-from prompt_toolkit.formatted_text import ANSI
-from openai import OpenAI
+if TYPE_CHECKING:
+    from prompt_toolkit.formatted_text import ANSI
 
 try:
     from dotenv import load_dotenv
@@ -38,6 +42,14 @@ class Config:
         enable_emoji: 是否启用表情符号
         enable_color: 是否启用颜色
         system_prompt: 系统提示词
+        history_window: 每次请求携带的历史消息条数上限（不含系统提示词，0 表示不限制）
+        enable_cache: 是否启用单次查询的响应缓存
+        cache_ttl: 缓存条目的有效期（秒，0 表示永不过期）
+        cache_max_entries: 缓存条目数上限，超出时淘汰最旧的条目
+        embedding_model: 语义缓存使用的向量模型 ID（为空时不启用语义缓存）
+        semantic_threshold: 语义缓存命中所需的最小余弦相似度
+        streaming_flush_interval_ms: 流式输出的合并刷新间隔（毫秒）
+        streaming_flush_bytes: 流式输出累计多少字节后立即刷新
     """
     api_key: str
     model_id: str = "deepseek-chat"
@@ -45,6 +57,14 @@ class Config:
     enable_emoji: bool = True
     enable_color: bool = True
     system_prompt: str = "你是一个能干的助手。"
+    history_window: int = 12
+    enable_cache: bool = True
+    cache_ttl: int = 86400
+    cache_max_entries: int = 500
+    embedding_model: str = ""
+    semantic_threshold: float = 0.95
+    streaming_flush_interval_ms: int = 16
+    streaming_flush_bytes: int = 256
 
     @classmethod
     def from_env(cls) -> "Config":
@@ -57,6 +77,14 @@ class Config:
         - DOLORES_BASE_URL: API 基础 URL（默认：https://api.deepseek.com）
         - DOLORES_ENABLE_EMOJI: 是否启用表情符号（默认：true）
         - DOLORES_ENABLE_COLOR: 是否启用颜色（默认：true）
+        - DOLORES_HISTORY_WINDOW: 每次请求携带的历史消息条数（默认：12，0 表示不限制）
+        - DOLORES_ENABLE_CACHE: 是否启用响应缓存（默认：true）
+        - DOLORES_CACHE_TTL: 缓存有效期，单位秒（默认：86400，0 表示永不过期）
+        - DOLORES_CACHE_MAX_ENTRIES: 缓存条目数上限（默认：500）
+        - DOLORES_EMBEDDING_MODEL: 语义缓存使用的向量模型 ID（默认：空，不启用）
+        - DOLORES_SEMANTIC_THRESHOLD: 语义缓存的相似度阈值（默认：0.95）
+        - DOLORES_STREAM_FLUSH_MS: 流式输出的合并刷新间隔，单位毫秒（默认：16）
+        - DOLORES_STREAM_FLUSH_BYTES: 流式输出的合并字节数阈值（默认：256）
         
         Returns:
             配置对象
@@ -74,6 +102,14 @@ class Config:
             base_url=os.getenv("DOLORES_BASE_URL", "https://api.deepseek.com"),
             enable_emoji=os.getenv("DOLORES_ENABLE_EMOJI", "true").lower() == "true",
             enable_color=os.getenv("DOLORES_ENABLE_COLOR", "true").lower() == "true",
+            history_window=int(os.getenv("DOLORES_HISTORY_WINDOW", "12")),
+            enable_cache=os.getenv("DOLORES_ENABLE_CACHE", "true").lower() == "true",
+            cache_ttl=int(os.getenv("DOLORES_CACHE_TTL", "86400")),
+            cache_max_entries=int(os.getenv("DOLORES_CACHE_MAX_ENTRIES", "500")),
+            embedding_model=os.getenv("DOLORES_EMBEDDING_MODEL", ""),
+            semantic_threshold=float(os.getenv("DOLORES_SEMANTIC_THRESHOLD", "0.95")),
+            streaming_flush_interval_ms=int(os.getenv("DOLORES_STREAM_FLUSH_MS", "16")),
+            streaming_flush_bytes=int(os.getenv("DOLORES_STREAM_FLUSH_BYTES", "256")),
         )
 
 
@@ -102,6 +138,29 @@ class Formatter:
             config: 配置对象
         """
         self.config = config
+        self._user_prefix = self._build_prefix("🧐 Q: ", "[Q] ", self.AnsiColors.BLUE)
+        self._assistant_prefix = self._build_prefix("🤖 A: ", "[A] ", self.AnsiColors.GREEN)
+
+    def _build_prefix(self, emoji_text: str, plain_text: str, color: str) -> str:
+        """
+        根据配置构建前缀字符串
+
+        配置在初始化后不再变化，因此前缀只需构建一次。
+
+        Args:
+            emoji_text: 启用表情符号时的前缀文本
+            plain_text: 未启用表情符号时的前缀文本
+            color: 启用颜色时使用的 ANSI 颜色代码
+
+        Returns:
+            前缀字符串
+        """
+        emoji = emoji_text if self.config.enable_emoji else plain_text
+
+        if self.config.enable_color:
+            return self.AnsiColors.BOLD + color + emoji + self.AnsiColors.RESET
+        else:
+            return emoji
 
     def get_user_prefix(self) -> str:
         """
@@ -116,12 +175,18 @@ class Formatter:
         Returns:
             用户输入前缀字符串
         """
-        emoji = "🧐 Q: " if self.config.enable_emoji else "[Q] "
-        
-        if self.config.enable_color:
-            return self.AnsiColors.BOLD + self.AnsiColors.BLUE + emoji + self.AnsiColors.RESET
-        else:
-            return emoji
+        return self._user_prefix
+
+    @functools.cached_property
+    def user_prefix_ansi(self) -> "ANSI":
+        """
+        预先解析好的用户输入前缀（prompt_toolkit 的 ANSI 对象）
+
+        前缀在初始化后不再变化，首次访问时解析一次 ANSI 转义序列并缓存，
+        交互模式下每轮直接复用。
+        """
+        from prompt_toolkit.formatted_text import ANSI
+        return ANSI(self._user_prefix)
 
     def get_assistant_prefix(self) -> str:
         """
@@ -136,12 +201,7 @@ class Formatter:
         Returns:
             助手输出前缀字符串
         """
-        emoji = "🤖 A: " if self.config.enable_emoji else "[A] "
-        
-        if self.config.enable_color:
-            return self.AnsiColors.BOLD + self.AnsiColors.GREEN + emoji + self.AnsiColors.RESET
-        else:
-            return emoji
+        return self._assistant_prefix
 
     def print_colored(self, text: str, end: str = "\n") -> None:
         """
@@ -151,7 +211,8 @@ class Formatter:
             text: 要打印的文本
             end: 行尾字符（默认：换行符）
         """
-        print(text, end=end, flush=True)
+        sys.stdout.write(text + end)
+        sys.stdout.flush()
 
     def clear_screen(self) -> None:
         """清屏，使用 ANSI 转义序列"""
@@ -159,23 +220,538 @@ class Formatter:
         sys.stdout.flush()
 
 
+class ResponseCache:
+    """响应缓存类，按 (模型, 消息列表) 精确匹配缓存 LLM 的完整回复
+
+    每条缓存以 JSON 文件的形式保存在缓存目录中，文件名为请求内容的哈希值。
+    条目按文件修改时间过期，写入时清理过期条目并在超出上限时淘汰最旧的条目。
+    """
+
+    def __init__(self, ttl: int = 86400, max_entries: int = 500, cache_dir: Optional[str] = None):
+        """
+        初始化响应缓存
+        
+        Args:
+            ttl: 条目有效期（秒，0 表示永不过期）
+            max_entries: 条目数上限
+            cache_dir: 缓存目录（默认：$XDG_CACHE_HOME/dolores/responses 或 ~/.cache/dolores/responses）
+        """
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.cache_dir = cache_dir or os.path.join(self.default_dir(), "responses")
+
+    @staticmethod
+    def default_dir() -> str:
+        """
+        获取默认缓存目录
+        
+        Returns:
+            $XDG_CACHE_HOME/dolores，未设置时为 ~/.cache/dolores
+        """
+        base = os.getenv("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+        return os.path.join(base, "dolores")
+
+    def _path(self, model: str, messages: List[Dict[str, str]]) -> str:
+        """
+        计算请求对应的缓存文件路径
+        
+        Args:
+            model: 模型 ID
+            messages: 消息列表
+            
+        Returns:
+            缓存文件路径
+        """
+        payload = json.dumps({"m": model, "msgs": messages}, sort_keys=True, ensure_ascii=False)
+        key = hashlib.blake2b(payload.encode("utf-8"), digest_size=20).hexdigest()
+        return os.path.join(self.cache_dir, key + ".json")
+
+    def get(self, model: str, messages: List[Dict[str, str]]) -> Optional[str]:
+        """
+        查找缓存的回复
+        
+        Args:
+            model: 模型 ID
+            messages: 消息列表
+            
+        Returns:
+            缓存的回复内容，未命中则返回 None
+        """
+        path = self._path(model, messages)
+        try:
+            if self.ttl > 0 and time.time() - os.path.getmtime(path) > self.ttl:
+                os.unlink(path)
+                return None
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)["response"]
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+
+    def set(self, model: str, messages: List[Dict[str, str]], response: str) -> None:
+        """
+        写入缓存，写入失败时静默忽略
+        
+        Args:
+            model: 模型 ID
+            messages: 消息列表
+            response: LLM 的回复内容
+        """
+        path = self._path(model, messages)
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            with tempfile.NamedTemporaryFile(
+                "w", encoding="utf-8", dir=self.cache_dir, suffix=".tmp", delete=False
+            ) as f:
+                json.dump({"response": response}, f, ensure_ascii=False)
+                temp_path = f.name
+            os.replace(temp_path, path)
+            self._prune()
+        except OSError:
+            pass
+
+    def _prune(self) -> None:
+        """删除过期条目，并在条目数超出上限时删除最旧的条目"""
+        entries = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.endswith(".json"):
+                try:
+                    entries.append((entry.stat().st_mtime, entry.path))
+                except OSError:
+                    pass
+
+        now = time.time()
+        entries.sort()
+        excess = len(entries) - self.max_entries
+        for i, (mtime, path) in enumerate(entries):
+            if i < excess or (self.ttl > 0 and now - mtime > self.ttl):
+                try:
+                    os.unlink(path)
+                except OSError:
+                    pass
+
+
+class SemanticCache:
+    """语义缓存类，按最后一条用户消息的向量相似度匹配缓存的回复
+
+    所有向量归一化后保存为一个连续的 float32 矩阵（semantic.npy），
+    查找时以内存映射方式加载并通过一次矩阵-向量乘法计算余弦相似度。
+    只有模型和之前的上下文（系统提示词等）完全一致的条目才会参与匹配。
+    与 ResponseCache 相同，条目超过有效期后不再命中，写入时清理过期条目并淘汰超出上限的最旧条目。
+    """
+
+    def __init__(
+        self,
+        threshold: float = 0.95,
+        ttl: int = 86400,
+        max_entries: int = 500,
+        cache_dir: Optional[str] = None,
+    ):
+        """
+        初始化语义缓存
+        
+        Args:
+            threshold: 命中所需的最小余弦相似度
+            ttl: 条目有效期（秒，0 表示永不过期）
+            max_entries: 条目数上限
+            cache_dir: 缓存目录（默认：$XDG_CACHE_HOME/dolores 或 ~/.cache/dolores）
+        """
+        try:
+            import numpy
+            self.np = numpy
+            self.available = True
+        except ImportError:
+            self.available = False
+            sys.stderr.write("Warning: numpy not installed. Semantic cache will be disabled.\n")
+            sys.stderr.write("Install it with: pip install numpy\n")
+
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.cache_dir = cache_dir or ResponseCache.default_dir()
+        self.vectors_path = os.path.join(self.cache_dir, "semantic.npy")
+        self.entries_path = os.path.join(self.cache_dir, "semantic.json")
+
+    @staticmethod
+    def _context_key(model: str, messages: List[Dict[str, str]]) -> str:
+        """
+        计算除最后一条消息外的上下文哈希
+        
+        Args:
+            model: 模型 ID
+            messages: 消息列表
+            
+        Returns:
+            上下文哈希字符串
+        """
+        payload = json.dumps({"m": model, "ctx": messages[:-1]}, sort_keys=True, ensure_ascii=False)
+        return hashlib.blake2b(payload.encode("utf-8"), digest_size=20).hexdigest()
+
+    def _normalize(self, embedding: List[float]):
+        """将向量转换为归一化的 float32 数组，零向量返回 None"""
+        vec = self.np.asarray(embedding, dtype=self.np.float32)
+        norm = float(self.np.linalg.norm(vec))
+        if norm == 0.0:
+            return None
+        return vec / norm
+
+    def _load_entries(self) -> List[Dict[str, str]]:
+        """读取缓存条目列表，读取失败或格式不符时返回空列表"""
+        try:
+            with open(self.entries_path, "r", encoding="utf-8") as f:
+                entries = json.load(f)
+            if all(
+                isinstance(entry["ctx"], str)
+                and isinstance(entry["response"], str)
+                and isinstance(entry["t"], (int, float))
+                for entry in entries
+            ):
+                return entries
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+        return []
+
+    def _is_expired(self, entry: Dict[str, str], now: float) -> bool:
+        """判断条目是否已超过有效期"""
+        return self.ttl > 0 and now - entry["t"] > self.ttl
+
+    def get(self, model: str, messages: List[Dict[str, str]], embedding: List[float]) -> Optional[str]:
+        """
+        查找语义相近的缓存回复
+        
+        Args:
+            model: 模型 ID
+            messages: 消息列表
+            embedding: 最后一条用户消息的向量
+            
+        Returns:
+            缓存的回复内容，未命中则返回 None
+        """
+        if not self.available:
+            return None
+
+        entries = self._load_entries()
+        query = self._normalize(embedding)
+        if not entries or query is None:
+            return None
+
+        try:
+            matrix = self.np.load(self.vectors_path, mmap_mode="r")
+        except (OSError, ValueError):
+            return None
+        if matrix.ndim != 2 or matrix.shape != (len(entries), query.shape[0]):
+            return None
+
+        context = self._context_key(model, messages)
+        now = time.time()
+        try:
+            mask = self.np.array(
+                [entry["ctx"] == context and not self._is_expired(entry, now) for entry in entries]
+            )
+            scores = self.np.where(mask, matrix @ query, -1.0)
+            best = int(self.np.argmax(scores))
+            if scores[best] >= self.threshold:
+                return entries[best]["response"]
+        except (KeyError, TypeError, ValueError):
+            pass
+        return None
+
+    def add(self, model: str, messages: List[Dict[str, str]], embedding: List[float], response: str) -> None:
+        """
+        添加一条缓存，写入失败时静默忽略
+        
+        Args:
+            model: 模型 ID
+            messages: 消息列表
+            embedding: 最后一条用户消息的向量
+            response: LLM 的回复内容
+        """
+        if not self.available:
+            return
+
+        vec = self._normalize(embedding)
+        if vec is None:
+            return
+
+        entries = self._load_entries()
+        matrix = None
+        if entries:
+            try:
+                matrix = self.np.load(self.vectors_path)
+            except (OSError, ValueError):
+                entries = []
+            else:
+                if matrix.ndim != 2 or matrix.shape != (len(entries), vec.shape[0]):
+                    entries, matrix = [], None
+
+        now = time.time()
+        if entries:
+            keep = [i for i, entry in enumerate(entries) if not self._is_expired(entry, now)]
+            keep = keep[max(len(keep) - self.max_entries + 1, 0):]
+            entries = [entries[i] for i in keep]
+            matrix = matrix[keep] if keep else None
+
+        entries.append({"ctx": self._context_key(model, messages), "response": response, "t": now})
+        if matrix is None:
+            matrix = vec[self.np.newaxis, :]
+        else:
+            matrix = self.np.vstack([matrix, vec])
+
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            with tempfile.NamedTemporaryFile(dir=self.cache_dir, suffix=".tmp", delete=False) as f:
+                self.np.save(f, matrix)
+                vectors_temp = f.name
+            with tempfile.NamedTemporaryFile(
+                "w", encoding="utf-8", dir=self.cache_dir, suffix=".tmp", delete=False
+            ) as f:
+                json.dump(entries, f, ensure_ascii=False)
+                entries_temp = f.name
+            os.replace(vectors_temp, self.vectors_path)
+            os.replace(entries_temp, self.entries_path)
+        except OSError:
+            pass
+
+
+class StreamWriter:
+    """流式输出写入类，合并高频到达的小块输出后再写入终端
+
+    写入策略：
+    - 以指数加权移动平均（EWMA）估计块之间的到达间隔
+    - 平均间隔超过刷新间隔的 2 倍时（输出较慢），每块立即写出
+    - 否则累计到字节阈值或距上次写出超过刷新间隔时再写出
+    - 后台守护线程保证累计内容最多等待一个刷新间隔，流暂停时也会及时写出
+
+    POSIX 平台上直接编码后写入文件描述符 1，绕过 TextIOWrapper 的锁和逐次编码；
+    其他平台或 stdout 没有文件描述符时回退到 sys.stdout。
+    """
+
+    # 到达间隔 EWMA 的平滑系数
+    EWMA_ALPHA = 0.2
+
+    def __init__(self, flush_interval: float = 0.016, flush_bytes: int = 256):
+        """
+        初始化写入器，应在开始接收流之前创建，使用完毕后调用 close()
+        
+        Args:
+            flush_interval: 刷新间隔（秒），0 表示每块立即写出
+            flush_bytes: 累计字节数阈值
+        """
+        self.flush_interval = flush_interval
+        self.flush_bytes = flush_bytes
+        self.fd = self._stdout_fd()
+        self.encoding = sys.stdout.encoding or "utf-8"
+        self.pending = []
+        self.pending_bytes = 0
+        self.last_flush = self.last_chunk = time.monotonic()
+        self.avg_gap = None
+        self.deadline = None
+        self.closed = False
+        self.cond = threading.Condition()
+        self.watchdog = None
+
+    @staticmethod
+    def _stdout_fd() -> Optional[int]:
+        """获取可直接写入的 stdout 文件描述符，不可用时返回 None"""
+        if os.name != "posix":
+            return None
+        try:
+            return sys.stdout.fileno()
+        except (AttributeError, OSError, ValueError):
+            return None
+
+    @classmethod
+    def output(cls, text: str) -> None:
+        """
+        立即将文本写入终端
+        
+        Args:
+            text: 要输出的文本
+        """
+        sys.stdout.flush()
+        fd = cls._stdout_fd()
+        if fd is None:
+            sys.stdout.write(text)
+            sys.stdout.flush()
+            return
+        cls._write_fd(fd, text.encode(sys.stdout.encoding or "utf-8", errors="replace"))
+
+    @staticmethod
+    def _write_fd(fd: int, data: bytes) -> None:
+        """将字节完整写入文件描述符，处理部分写入"""
+        view = memoryview(data)
+        while view:
+            written = os.write(fd, view)
+            view = view[written:]
+
+    def write(self, content: str) -> None:
+        """
+        追加一块流式输出，按写入策略决定是否立即写出
+        
+        Args:
+            content: 新到达的输出内容
+        """
+        with self.cond:
+            now = time.monotonic()
+            gap = now - self.last_chunk
+            self.last_chunk = now
+            if self.avg_gap is None:
+                self.avg_gap = gap
+            else:
+                self.avg_gap = self.EWMA_ALPHA * gap + (1 - self.EWMA_ALPHA) * self.avg_gap
+
+            if self.fd is None:
+                self.pending.append(content)
+                self.pending_bytes += len(content)
+            else:
+                data = content.encode(self.encoding, errors="replace")
+                self.pending.append(data)
+                self.pending_bytes += len(data)
+
+            if (
+                self.avg_gap > 2 * self.flush_interval
+                or self.pending_bytes >= self.flush_bytes
+                or now - self.last_flush >= self.flush_interval
+            ):
+                self._flush_locked()
+            elif self.deadline is None:
+                self.deadline = self.last_flush + self.flush_interval
+                if self.watchdog is None:
+                    self.watchdog = threading.Thread(target=self._watch, daemon=True)
+                    self.watchdog.start()
+                self.cond.notify()
+
+    def _watch(self) -> None:
+        """守护线程：累计内容到达刷新期限仍未写出时主动写出"""
+        with self.cond:
+            while not self.closed:
+                if self.deadline is None:
+                    self.cond.wait()
+                    continue
+                remaining = self.deadline - time.monotonic()
+                if remaining > 0:
+                    self.cond.wait(remaining)
+                    continue
+                self._flush_locked()
+
+    def _flush_locked(self) -> None:
+        """写出所有累计的内容，调用方需持有 self.cond"""
+        if self.pending:
+            sys.stdout.flush()
+            if self.fd is None:
+                sys.stdout.write("".join(self.pending))
+                sys.stdout.flush()
+            else:
+                self._write_fd(self.fd, b"".join(self.pending))
+            self.pending.clear()
+        self.pending_bytes = 0
+        self.deadline = None
+        self.last_flush = time.monotonic()
+
+    def close(self, end: str = "") -> None:
+        """
+        写出所有累计的内容并停止守护线程
+        
+        Args:
+            end: 随本次写出一起追加的结尾字符
+        """
+        with self.cond:
+            if end:
+                self.pending.append(end if self.fd is None else end.encode(self.encoding, errors="replace"))
+            self._flush_locked()
+            self.closed = True
+            self.cond.notify()
+        if self.watchdog is not None:
+            self.watchdog.join()
+
+
 class LLMClient:
     """LLM 客户端类，负责与 OpenAI API 进行交互"""
 
     def __init__(self, config: Config):
         self.config = config
-        self.client = OpenAI(api_key=config.api_key, base_url=config.base_url)
+        self.cache = None
+        if config.enable_cache:
+            self.cache = ResponseCache(ttl=config.cache_ttl, max_entries=config.cache_max_entries)
+        self.semantic_cache = None
+        if config.enable_cache and config.embedding_model:
+            self.semantic_cache = SemanticCache(
+                threshold=config.semantic_threshold,
+                ttl=config.cache_ttl,
+                max_entries=config.cache_max_entries,
+            )
+
+    @functools.cached_property
+    def client(self):
+        """
+        OpenAI 客户端，首次访问时才导入 openai 并创建
+
+        仅执行 shell 命令或清屏等操作时无需加载 openai，可缩短启动时间。
+        底层使用长连接保活的 httpx 客户端，交互模式下多轮对话复用同一连接，
+        避免重复 TLS 握手；安装了 h2 时启用 HTTP/2。
+        """
+        import httpx
+        from openai import OpenAI, DefaultHttpxClient
+
+        try:
+            import h2  # noqa: F401
+            http2 = True
+        except ImportError:
+            http2 = False
 
-    def query(self, messages: List[Dict[str, str]]) -> Optional[str]:
+        # 连接数上限与 SDK 默认值一致，只延长空闲连接的保活时间（httpx 默认 5 秒）
+        http_client = DefaultHttpxClient(
+            http2=http2,
+            limits=httpx.Limits(max_connections=1000, max_keepalive_connections=100, keepalive_expiry=300),
+        )
+        return OpenAI(api_key=self.config.api_key, base_url=self.config.base_url, http_client=http_client)
+
+    def _embed(self, text: str) -> Optional[List[float]]:
+        """
+        调用向量接口计算文本的向量
+        
+        Args:
+            text: 要计算向量的文本
+            
+        Returns:
+            文本向量，如果发生错误则返回 None
+        """
+        try:
+            result = self.client.embeddings.create(model=self.config.embedding_model, input=text)
+            return result.data[0].embedding
+        except Exception as e:
+            sys.stderr.write(f"Embedding Error: {str(e)}\n")
+            return None
+
+    def query(
+        self, messages: List[Dict[str, str]], end: str = "\n", use_cache: bool = False
+    ) -> Optional[str]:
         """
         执行 LLM 查询（流式输出）
         
         Args:
             messages: 消息列表，包含对话历史
+            end: 流结束时随最后一批内容一起写出的结尾字符（默认：换行符）
+            use_cache: 是否使用响应缓存（仅在配置启用缓存时生效）
             
         Returns:
             LLM 的响应内容，如果发生错误则返回 None
         """
+        cache = self.cache if use_cache else None
+        embedding = None
+        if cache:
+            cached = cache.get(self.config.model_id, messages)
+            if cached is None and self.semantic_cache:
+                embedding = self._embed(messages[-1]["content"])
+                if embedding is not None:
+                    cached = self.semantic_cache.get(self.config.model_id, messages, embedding)
+            if cached is not None:
+                StreamWriter.output(cached + end)
+                return cached
+
+        writer = StreamWriter(
+            flush_interval=self.config.streaming_flush_interval_ms / 1000,
+            flush_bytes=self.config.streaming_flush_bytes,
+        )
         try:
             stream = self.client.chat.completions.create(
                 model=self.config.model_id,
@@ -183,14 +759,23 @@ class LLMClient:
                 stream=True
             )
             response = []
-            for chunk in stream:
-                if chunk.choices and chunk.choices[0].delta.content:
-                    content = chunk.choices[0].delta.content
-                    sys.stdout.write(content)
-                    sys.stdout.flush()
-                    response.append(content)
-            print()
-            return "".join(response)
+            completed = False
+            try:
+                for chunk in stream:
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        content = chunk.choices[0].delta.content
+                        response.append(content)
+                        writer.write(content)
+                completed = True
+            finally:
+                # 流中途出错或被中断时也要写出已收到的内容
+                writer.close(end if completed else "")
+            result = "".join(response)
+            if cache and result:
+                cache.set(self.config.model_id, messages, result)
+                if embedding is not None:
+                    self.semantic_cache.add(self.config.model_id, messages, embedding, result)
+            return result
         except Exception as e:
             sys.stderr.write(f"\nError: {str(e)}\n")
             return None
@@ -199,12 +784,37 @@ class LLMClient:
 class CommandExecutor:
     """命令执行类，负责执行 shell 命令并处理输出"""
 
+    # 每次从管道读取的最大字节数
+    READ_SIZE = 65536
+    # 需要交给 shell 解释的字符（管道、重定向、变量、通配符、转义等）
+    SHELL_METACHARS = re.compile(r"[|&;<>()$`\\*?\[\]{}~#=\n]")
+
     def __init__(self, formatter: Formatter):
         self.formatter = formatter
 
+    def _split_simple_command(self, command: str) -> Optional[List[str]]:
+        """
+        将不含 shell 元字符的简单命令拆分为参数列表
+
+        简单命令可以直接 exec 执行，省去启动 /bin/sh 的开销；
+        含元字符的命令或非 POSIX 平台返回 None，交由 shell 执行。
+
+        Args:
+            command: 要执行的命令
+
+        Returns:
+            参数列表，无法直接执行时返回 None
+        """
+        if os.name != "posix" or self.SHELL_METACHARS.search(command):
+            return None
+        try:
+            return shlex.split(command) or None
+        except ValueError:
+            return None
+
     def execute(self, command: str) -> str:
         """
-        执行 shell 命令并实时流式输出结果
+        执行 shell 命令并实时流式输出结果（execute_async 的同步封装）
         
         Args:
             command: 要执行的 shell 命令
@@ -212,30 +822,55 @@ class CommandExecutor:
         Returns:
             命令的输出内容
         """
+        return asyncio.run(self.execute_async(command))
+
+    async def execute_async(self, command: str) -> str:
+        """
+        异步执行 shell 命令并实时流式输出结果
+        
+        Args:
+            command: 要执行的 shell 命令
+            
+        Returns:
+            命令的输出内容
+        """
+        proc = None
         try:
-            proc = subprocess.Popen(
-                command,
-                shell=True,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.STDOUT,
-                text=True,
-                bufsize=1,
-                universal_newlines=True,
-            )
-            output = []
+            argv = self._split_simple_command(command)
+            if argv:
+                try:
+                    proc = await asyncio.create_subprocess_exec(
+                        *argv,
+                        stdout=asyncio.subprocess.PIPE,
+                        stderr=asyncio.subprocess.STDOUT,
+                    )
+                except OSError:
+                    proc = None
+            if proc is None:
+                proc = await asyncio.create_subprocess_shell(
+                    command,
+                    stdout=asyncio.subprocess.PIPE,
+                    stderr=asyncio.subprocess.STDOUT,
+                )
+            out = sys.stdout.buffer
+            output = bytearray()
             while True:
-                line = proc.stdout.readline()
-                if not line and proc.poll() is not None:
+                chunk = await proc.stdout.read(self.READ_SIZE)
+                if not chunk:
                     break
-                if line:
-                    sys.stdout.write(line)
-                    sys.stdout.flush()
-                    output.append(line)
-            return "".join(output)
+                out.write(chunk)
+                out.flush()
+                output.extend(chunk)
+            await proc.wait()
+            return output.decode("utf-8", errors="replace")
         except Exception as e:
             error_msg = f"\nError executing command: {str(e)}"
             sys.stdout.write(error_msg + "\n")
             return error_msg
+        finally:
+            if proc is not None and proc.returncode is None:
+                proc.kill()
+                await proc.wait()
 
 
 class InputHandler:
@@ -244,18 +879,13 @@ class InputHandler:
     def __init__(self, formatter: Formatter):
         self.formatter = formatter
 
-    def get_input(self, prompt: str) -> str:
+    @functools.cached_property
+    def session(self):
         """
-        获取用户输入（支持中文编辑/方向键）
-        
-        Args:
-            prompt: 输入提示符
-            
-        Returns:
-            用户输入的内容
+        prompt_toolkit 输入会话，首次在终端中读取输入时创建，之后各轮复用
         """
-        if not sys.stdin.isatty():
-            return input(prompt).strip()
+        from prompt_toolkit import PromptSession
+        from prompt_toolkit.key_binding import KeyBindings
 
         bindings = KeyBindings()
 
@@ -263,15 +893,32 @@ class InputHandler:
         def _(event):
             event.app.exit(exception=KeyboardInterrupt)
 
-        session = PromptSession(
+        return PromptSession(
             key_bindings=bindings,
             vi_mode=False,
             multiline=False,
             mouse_support=False
         )
 
-        return session.prompt(
-            message=ANSI(prompt),
+    def get_input(self, prompt: Union[str, "ANSI"]) -> str:
+        """
+        获取用户输入（支持中文编辑/方向键）
+        
+        Args:
+            prompt: 输入提示符，可以是字符串或预先解析好的 ANSI 对象
+            
+        Returns:
+            用户输入的内容
+        """
+        if not sys.stdin.isatty():
+            return input(getattr(prompt, "value", prompt)).strip()
+
+        if isinstance(prompt, str):
+            from prompt_toolkit.formatted_text import ANSI
+            prompt = ANSI(prompt)
+
+        return self.session.prompt(
+            message=prompt,
             wrap_lines=True,
             enable_history_search=False
         ).strip()
@@ -284,9 +931,9 @@ class InputHandler:
             管道输入的内容，如果没有管道输入则返回 None
         """
         if not sys.stdin.isatty():
-            content = sys.stdin.read()
-            if content:
-                return content.strip()
+            data = sys.stdin.buffer.read()
+            if data:
+                return data.decode("utf-8", errors="replace").strip()
         return None
 
 
@@ -427,6 +1074,11 @@ class DoloresApp:
     - 用户输入处理
     """
 
+    # 命令执行结果以助手消息的形式追加到历史中，使用该前缀标识
+    COMMAND_RESULT_HEADER = "命令执行结果:\n"
+    # 翻译模式下追加到输入文本末尾的指令
+    TRANSLATE_SUFFIX = "\n请将以上文本翻译成中文\n"
+
     def __init__(self, config: Config):
         """
         初始化应用
@@ -441,10 +1093,19 @@ class DoloresApp:
         self.input_handler = InputHandler(self.formatter)
         self.tts_client = TTSClient()
         self.messages = [{"role": "system", "content": config.system_prompt}]
+        self._history_start = 1
+        self._last_reply = None
+        self._builtin_commands = {
+            "clear": self._handle_clear,
+            "/speak": self._handle_speak,
+        }
+        self._max_builtin_len = max(len(name) for name in self._builtin_commands)
 
     def reset_conversation(self) -> None:
         """重置对话历史，保留系统提示词"""
         self.messages = [{"role": "system", "content": self.config.system_prompt}]
+        self._history_start = 1
+        self._last_reply = None
         self.formatter.print_colored("对话历史已重置")
 
     def process_user_input(self, user_input: str) -> None:
@@ -456,27 +1117,34 @@ class DoloresApp:
         - "/speak": 朗读上一次的回复
         - 以 "!" 开头: 执行 shell 命令
         - 其他: 发送给 LLM 进行处理
+
+        对话历史只追加、不修改：messages[0] 的系统提示词初始化后保持不变，
+        每一轮只在末尾追加消息，使历史前缀在多次请求间逐字节一致，
+        从而命中服务端的前缀缓存（prompt caching）。
         
         Args:
             user_input: 用户输入的内容
         """
-        if user_input.strip().lower() == "clear":
-            self.formatter.clear_screen()
-            self.reset_conversation()
-            return
-
-        if user_input.strip().lower() == "/speak":
-            self._handle_speak()
-            return
-
-        if not user_input:
+        stripped = user_input.strip()
+        if not stripped:
             print()
             return
 
-        if user_input.startswith("!"):
-            self._handle_command(user_input)
+        if len(stripped) <= self._max_builtin_len:
+            handler = self._builtin_commands.get(stripped.lower())
+            if handler:
+                handler()
+                return
+
+        if stripped.startswith("!"):
+            self._handle_command(stripped)
         else:
-            self._handle_llm_query(user_input)
+            self._handle_llm_query(stripped)
+
+    def _handle_clear(self) -> None:
+        """清屏并重置对话历史"""
+        self.formatter.clear_screen()
+        self.reset_conversation()
 
     def _handle_command(self, user_input: str) -> None:
         """
@@ -495,8 +1163,8 @@ class DoloresApp:
         print()
 
         self.messages.append({
-            "role": "system",
-            "content": f"命令执行结果:\n{cmd_output}",
+            "role": "assistant",
+            "content": self.COMMAND_RESULT_HEADER + cmd_output,
         })
 
     def _handle_llm_query(self, user_input: str) -> None:
@@ -508,23 +1176,61 @@ class DoloresApp:
         """
         self.messages.append({"role": "user", "content": user_input})
         self.formatter.print_colored(self.formatter.get_assistant_prefix(), end="")
-        assistant_response = self.llm_client.query(self.messages)
+        assistant_response = self.llm_client.query(self._windowed_messages(), end="\n\n")
 
         if assistant_response:
-            self.messages.append({"role": "assistant", "content": assistant_response})
+            self._append_reply(assistant_response)
         else:
             sys.stderr.write("获取响应失败，请重试\n")
-        print()
+            print()
+
+    def _windowed_messages(self) -> List[Dict[str, str]]:
+        """
+        获取本次请求要发送的消息列表
+
+        保留系统提示词和从截断点开始的历史消息，使每轮请求的上下文长度有上界。
+        截断按块进行：超过 history_window 条时，截断点一次前移到只保留约一半的位置，
+        之后保持不变直到再次超出，这样多轮请求的前缀保持一致，仍能命中前缀缓存。
+        截断点向前对齐到用户消息，因此截断后的历史总是从用户消息开始，且不少于约一半窗口。
+
+        Returns:
+            要发送给 LLM 的消息列表
+        """
+        window = self.config.history_window
+        if window <= 0:
+            return self.messages
+
+        if len(self.messages) - self._history_start > window:
+            start = len(self.messages) - max(window // 2, 1)
+            while start > self._history_start and self.messages[start]["role"] != "user":
+                start -= 1
+            self._history_start = start
+
+        if self._history_start <= 1:
+            return self.messages
+        return [self.messages[0]] + self.messages[self._history_start:]
 
     def _handle_speak(self) -> None:
         """朗读上一次的助手回复"""
-        for msg in reversed(self.messages):
-            if msg["role"] == "assistant":
-                response_text = msg["content"]
-                if response_text:
-                    self.formatter.print_colored(f"🔊 正在朗读...")
-                    self.tts_client.speak(response_text)
-                return
+        if self._last_reply is None:
+            return
+        response_text = self.messages[self._last_reply]["content"]
+        if response_text:
+            self.formatter.print_colored(f"🔊 正在朗读...")
+            self.tts_client.speak(response_text)
+
+    def _append_reply(self, response: str) -> None:
+        """
+        追加一条 LLM 回复并记录其位置
+
+        命令执行结果同样以助手消息的形式保存，/speak 依据记录的位置
+        朗读真正的 LLM 回复，而不是按内容区分。
+
+        Args:
+            response: LLM 的回复内容
+        """
+        self.messages.append({"role": "assistant", "content": response})
+        self._last_reply = len(self.messages) - 1
 
     def single_query(self, question: str) -> None:
         """
@@ -533,16 +1239,17 @@ class DoloresApp:
         Args:
             question: 要查询的问题
         """
-        messages = [
-            {"role": "system", "content": self.config.system_prompt},
-            {"role": "user", "content": question},
-        ]
-        self.formatter.print_colored(self.formatter.get_user_prefix() + question)
-        self.formatter.print_colored(self.formatter.get_assistant_prefix(), end="")
+        self.messages.append({"role": "user", "content": question})
+        self.formatter.print_colored(
+            self.formatter.get_user_prefix() + question + "\n" + self.formatter.get_assistant_prefix(),
+            end="",
+        )
 
-        assistant_response = self.llm_client.query(messages)
+        assistant_response = self.llm_client.query(self.messages, use_cache=True)
         if not assistant_response:
+            self.messages.pop()
             sys.exit(1)
+        self._append_reply(assistant_response)
 
     def interactive_mode(self, initial_input: Optional[str] = None) -> None:
         """
@@ -555,11 +1262,13 @@ class DoloresApp:
         
         if initial_input:
             self.messages.append({"role": "user", "content": initial_input})
-            self.formatter.print_colored(self.formatter.get_user_prefix() + initial_input)
-            self.formatter.print_colored(self.formatter.get_assistant_prefix(), end="")
+            self.formatter.print_colored(
+                self.formatter.get_user_prefix() + initial_input + "\n" + self.formatter.get_assistant_prefix(),
+                end="",
+            )
             assistant_response = self.llm_client.query(self.messages)
             if assistant_response:
-                self.messages.append({"role": "assistant", "content": assistant_response})
+                self._append_reply(assistant_response)
 
         if not is_tty:
             return
@@ -567,7 +1276,7 @@ class DoloresApp:
         print("进入对话模式（输入 exit 退出）")
         while True:
             try:
-                user_input = self.input_handler.get_input(self.formatter.get_user_prefix())
+                user_input = self.input_handler.get_input(self.formatter.user_prefix_ansi)
 
                 if user_input.lower() in ["exit", "quit"]:
                     break
@@ -588,19 +1297,13 @@ class DoloresApp:
         Args:
             args: 命令行参数
         """
-        in_text = None
-        in_text_list = []
         piped_input = self.input_handler.read_piped_input()
-
-        if piped_input:
-            in_text_list.append(piped_input)
+        in_text = piped_input or ""
         if args.text:
-            in_text_list.append("".join(args.text))
-        if args.translate and in_text_list:
-            in_text_list.append("\n请将以上文本翻译成中文\n")
+            in_text += " ".join(args.text)
+        if in_text and args.translate:
+            in_text += self.TRANSLATE_SUFFIX
 
-        if in_text_list:
-            in_text = "".join(in_text_list)
         if args.print_text and in_text:
             sys.stdout.write(in_text)
 
@@ -629,17 +1332,23 @@ class DoloresApp:
 
 def main():
     """主函数"""
-    config = Config.from_env()
-    app = DoloresApp(config)
-
     parser = argparse.ArgumentParser(description="AI命令行助手")
     parser.add_argument("text", nargs="*", help="输入问题（直接模式）")
     parser.add_argument("-r", "--repl", action="store_true", help="进入交互模式")
     parser.add_argument("-t", "--translate", action="store_true", help="翻译")
     parser.add_argument("-P", "--print-text", action="store_true", help="打印完整的输入文本")
     parser.add_argument("-p", "--prompt", type=str, help="输入提示词")
+    parser.add_argument("--no-cache", action="store_true", help="不使用响应缓存")
+    parser.add_argument("--stream-flush-ms", type=int, help="流式输出的合并刷新间隔（毫秒）")
     args = parser.parse_args()
 
+    config = Config.from_env()
+    if args.no_cache:
+        config.enable_cache = False
+    if args.stream_flush_ms is not None:
+        config.streaming_flush_interval_ms = args.stream_flush_ms
+    app = DoloresApp(config)
+
     app.run(args)
 
 